@@ -8,139 +8,313 @@ import numpy as np
 import pandas as pd
 import joblib
 import os
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
-from sklearn.metrics import accuracy_score
+from scipy import sparse
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+
+# Explicit dtypes for every column we train on, so the C parser never has to
+# infer types chunk by chunk (LoanSeqNum is an ID and is never read).
+# Numeric columns are float32 so a blank cell parses as NaN and is
+# median-filled later instead of aborting the read; float32 holds every
+# integer value here exactly (all are below 2**24). Low-cardinality codes are
+# read as categoricals so string cleanup only touches the handful of
+# distinct values, not every row
+CSV_DTYPES = {
+    'CreditScore': 'float32',
+    'FirstPaymentDate': 'float32',
+    'FirstTimeHomebuyer': 'category',
+    'MaturityDate': 'float32',
+    'MSA': 'object',
+    'MIP': 'float32',
+    'Units': 'float32',
+    'Occupancy': 'category',
+    'OCLTV': 'float32',
+    'DTI': 'float32',
+    'OrigUPB': 'float32',
+    'LTV': 'float32',
+    'OrigInterestRate': 'float32',
+    'Channel': 'category',
+    'PPM': 'category',
+    'ProductType': 'category',
+    'PropertyState': 'category',
+    'PropertyType': 'category',
+    'PostalCode': 'object',
+    'LoanPurpose': 'category',
+    'OrigLoanTerm': 'float32',
+    'NumBorrowers': 'float32',
+    'SellerName': 'object',
+    'ServicerName': 'object',
+    'EverDelinquent': 'float32',
+    'MonthsDelinquent': 'float32',
+    'MonthsInRepayment': 'float32',
+}
+
+# Values the parser should read as missing ('X ' marks an unknown borrower count)
+CSV_NA_VALUES = {'NumBorrowers': ['X ']}
+
+CHUNK_SIZE = 100_000
+TEST_SIZE = 0.2
+EPOCHS = 5
+
+TARGET_COL = 'EverDelinquent'
+HIGH_CARDINALITY_COLS = ['PostalCode', 'MSA', 'SellerName', 'ServicerName']
+# YYYYMM dates are split into year and month features
+DATE_COLS = {
+    'FirstPaymentDate': ('FirstPaymentYear', 'FirstPaymentMonth'),
+    'MaturityDate': ('MaturityYear', 'MaturityMonth'),
+}
+CATEGORICAL_COLS = ['PropertyState', 'PropertyType', 'FirstTimeHomebuyer',
+                    'Occupancy', 'LoanPurpose', 'Channel', 'PPM', 'ProductType']
+
+def read_mortgage_chunks(csv_path, chunksize=CHUNK_SIZE):
+    """Stream LoanExport.csv in fixed-size chunks"""
+    return pd.read_csv(
+        csv_path,
+        chunksize=chunksize,
+        dtype=CSV_DTYPES,
+        usecols=list(CSV_DTYPES),
+        na_values=CSV_NA_VALUES,
+        skipinitialspace=True,
+        engine="c"
+    )
+
+def _median_from_counts(counts):
+    """Exact median of a column from its accumulated value counts"""
+    counts = counts.sort_index()
+    cumulative = counts.cumsum().to_numpy()
+    values = counts.index.to_numpy(dtype=np.float64)
+    total = cumulative[-1]
+    lower = values[np.searchsorted(cumulative, (total + 1) // 2)]
+    upper = values[np.searchsorted(cumulative, total // 2 + 1)]
+    return (lower + upper) / 2
+
+def _fit_code_map(values):
+    """Hash-based label encoding: category -> code, in order of first appearance"""
+    _, categories = pd.factorize(values, sort=False)
+    return {value: code for code, value in enumerate(categories)}
 
 def load_real_mortgage_data(csv_path="LoanExport.csv"):
-    """Load real mortgage data from LoanExport.csv"""
-    print(f"🏠 Loading REAL mortgage data from {csv_path}")
+    """Scan LoanExport.csv chunk by chunk and collect training statistics"""
+    print(f"🏠 Scanning REAL mortgage data from {csv_path}")
     
     if not os.path.exists(csv_path):
         raise FileNotFoundError(f"CSV file not found: {csv_path}")
     
-    # Load the actual mortgage data
-    print("   Loading CSV file...")
-    df = pd.read_csv(csv_path, low_memory=False)
-    
-    # Clean column names (remove any spaces)
-    df.columns = df.columns.str.strip()
-    
-    print(f"✅ REAL mortgage data loaded:")
-    print(f"   Records: {len(df):,}")
-    print(f"   Features: {len(df.columns) - 1}")
+    # Only per-column summaries are kept, so memory is bounded by chunk size
+    print(f"   Reading CSV in chunks of {CHUNK_SIZE:,} rows...")
+    records = 0
+    delinquent = 0
+    sample = None
+    value_counts = {}
+    uniques = {col: [] for col in HIGH_CARDINALITY_COLS + CATEGORICAL_COLS}
+    
+    for chunk in read_mortgage_chunks(csv_path):
+        chunk = chunk.dropna(subset=[TARGET_COL])
+        # Sample rows all have a target, so each one gets a test prediction
+        if sample is None and len(chunk) > 0:
+            sample = chunk.head(3)
+        
+        records += len(chunk)
+        delinquent += int(chunk[TARGET_COL].sum())
+        
+        for col in chunk.select_dtypes(include=[np.number]).columns:
+            if col == TARGET_COL:
+                continue
+            counts = chunk[col].value_counts()
+            if col in value_counts:
+                counts = value_counts[col].add(counts, fill_value=0)
+            value_counts[col] = counts
+        
+        for col in HIGH_CARDINALITY_COLS:
+            uniques[col].append(pd.unique(chunk[col].fillna('Unknown')))
+        for col in CATEGORICAL_COLS:
+            uniques[col].append(chunk[col].cat.categories.str.strip())
+            if chunk[col].hasnans:
+                uniques[col].append(np.array(['Unknown']))
+    
+    stats = {
+        'records': records,
+        'delinquent': delinquent,
+        'sample': sample,
+        'medians': {col: _median_from_counts(counts) for col, counts in value_counts.items()},
+        'uniques': {col: pd.unique(np.concatenate(parts)) for col, parts in uniques.items()},
+    }
     
-    # Check target variable
-    if 'EverDelinquent' in df.columns:
-        default_rate = df['EverDelinquent'].mean()
-        print(f"   Default rate: {default_rate:.1%}")
-        print(f"   Delinquent loans: {df['EverDelinquent'].sum():,}")
-        print(f"   Non-delinquent loans: {(df['EverDelinquent'] == 0).sum():,}")
-    else:
-        raise ValueError("EverDelinquent column not found in CSV")
+    print(f"✅ REAL mortgage data scanned:")
+    print(f"   Records: {records:,}")
+    print(f"   Features: {len(CSV_DTYPES) - 1}")
+    print(f"   Default rate: {delinquent / records:.1%}")
+    print(f"   Delinquent loans: {delinquent:,}")
+    print(f"   Non-delinquent loans: {records - delinquent:,}")
     
     # Show data sample
     print(f"\n📊 Sample data:")
-    print(df.head(2))
+    print(sample.head(2))
     
-    return df
+    return stats
 
-def preprocess_data(df):
-    """Preprocess mortgage data for training"""
-    print("\n🔄 PREPROCESSING REAL MORTGAGE DATA")
+def fit_preprocessing(stats):
+    """Build preprocessing info (encoders, feature layout) from scan statistics"""
+    print("\n🔄 FITTING PREPROCESSING ON REAL MORTGAGE DATA")
     print("-" * 40)
     
-    # Drop rows with missing target
-    print(f"Before cleaning: {len(df):,} records")
-    df = df.dropna(subset=['EverDelinquent'])
-    print(f"After removing missing target: {len(df):,} records")
-    
-    # Separate features and target
-    X = df.drop('EverDelinquent', axis=1)
-    y = df['EverDelinquent']
-    
-    # Exclude unique identifiers that shouldn't be used for prediction
-    exclude_cols = ['LoanSeqNum']  # Loan sequence number is just an ID
-    exclude_cols_present = [col for col in exclude_cols if col in X.columns]
-    if exclude_cols_present:
-        X = X.drop(columns=exclude_cols_present)
-        print(f"Excluded ID columns: {exclude_cols_present}")
-    
-    # Store preprocessing info
     preprocessing_info = {
         'feature_encoders': {},
         'feature_names': [],
-        'categorical_columns': []
+        'categorical_columns': list(CATEGORICAL_COLS),
+        'numeric_columns': [],
+        'category_dtypes': {},
+        'numeric_medians': stats['medians'],
+        'date_columns': dict(DATE_COLS)
     }
     
-    # Handle missing values in numeric columns first
-    numeric_cols = X.select_dtypes(include=[np.number]).columns.tolist()
-    if len(numeric_cols) > 0:
-        print(f"Filling missing values in {len(numeric_cols)} numeric columns...")
-        X[numeric_cols] = X[numeric_cols].fillna(X[numeric_cols].median())
-    
     # Encode high-cardinality categorical columns (following your Jupyter notebook approach)
-    high_cardinality_cols = ['PostalCode', 'MSA', 'SellerName', 'ServicerName']
-    
-    for col in high_cardinality_cols:
-        if col in X.columns:
-            print(f"Label encoding: {col} ({X[col].nunique()} unique values)")
-            le = LabelEncoder()
-            # Handle missing values in categorical columns
-            X[col] = X[col].fillna('Unknown')
-            X[col] = le.fit_transform(X[col].astype(str))
-            preprocessing_info['feature_encoders'][col] = le
-    
-    # Handle remaining categorical columns
-    categorical_cols = ['PropertyState', 'PropertyType', 'FirstTimeHomebuyer', 
-                       'Occupancy', 'LoanPurpose', 'Channel', 'PPM', 'ProductType']
-    
-    # Clean and encode remaining categorical columns
-    for col in categorical_cols:
-        if col in X.columns:
-            # Clean string values (remove trailing spaces)
-            X[col] = X[col].astype(str).str.strip()
-            # Fill missing values
-            X[col] = X[col].fillna('Unknown')
-            preprocessing_info['categorical_columns'].append(col)
-    
-    # One-hot encode the cleaned categorical columns
-    X = pd.get_dummies(X, columns=categorical_cols, drop_first=True)
-    
-    # Final cleanup: ensure all columns are numeric
-    print(f"Final data type cleaning...")
-    for col in X.columns:
-        if X[col].dtype == 'object':
-            print(f"  Converting {col} from object to numeric")
-            # Try to convert to numeric, replace errors with 0
-            X[col] = pd.to_numeric(X[col], errors='coerce').fillna(0)
-    
-    # Store final feature names
-    preprocessing_info['feature_names'] = list(X.columns)
-    
-    print(f"  Original features: {len(df.columns) - 1}")
-    print(f"  Final features: {len(X.columns)}")
+    for col in HIGH_CARDINALITY_COLS:
+        values = stats['uniques'][col]
+        print(f"Label encoding: {col} ({len(values)} unique values)")
+        preprocessing_info['feature_encoders'][col] = _fit_code_map(values)
+    
+    # Numeric and label-encoded columns keep their CSV order, one-hot columns follow
+    numeric_columns = []
+    for col in CSV_DTYPES:
+        if col in DATE_COLS:
+            numeric_columns.extend(DATE_COLS[col])
+        elif col != TARGET_COL and col not in CATEGORICAL_COLS:
+            numeric_columns.append(col)
+    preprocessing_info['numeric_columns'] = numeric_columns
+    # Fixed category sets: every chunk (and every API request) one-hot encodes
+    # to the same columns, and the first category is the reference level
+    dummy_columns = []
+    for col in CATEGORICAL_COLS:
+        dtype = pd.CategoricalDtype(categories=sorted(stats['uniques'][col]), ordered=False)
+        preprocessing_info['category_dtypes'][col] = dtype
+        dummy_columns.extend(f"{col}_{value}" for value in dtype.categories[1:])
+    
+    preprocessing_info['feature_names'] = preprocessing_info['numeric_columns'] + dummy_columns
+    
+    print(f"  Original features: {len(CSV_DTYPES) - 1}")
+    print(f"  Final features: {len(preprocessing_info['feature_names'])}")
     print(f"  Encoded columns: {len(preprocessing_info['feature_encoders'])}")
     
-    return X, y, preprocessing_info
+    return preprocessing_info
+
+def preprocess_data(df, preprocessing_info):
+    """Preprocess one chunk of mortgage data for training"""
+    # Drop rows with missing target
+    df = df.dropna(subset=[TARGET_COL])
+    
+    # Separate features and target
+    X = df.drop(TARGET_COL, axis=1)
+    y = df[TARGET_COL].astype(int)
+    
+    # Handle missing values in numeric columns first. Every numeric column is
+    # read as float, so one NaN scan covers them all, and the block is
+    # written back only when something was actually missing
+    float_cols = X.select_dtypes(include=[np.floating]).columns.tolist()
+    if len(float_cols) > 0:
+        block = X[float_cols].to_numpy()
+        rows, cols = np.nonzero(np.isnan(block))
+        if len(rows) > 0:
+            medians = np.array([preprocessing_info['numeric_medians'][col] for col in float_cols])
+            block[rows, cols] = np.take(medians, cols)
+            X[float_cols] = block
+    
+    # Split YYYYMM dates so the model sees ordered year and month values
+    for col, (year_col, month_col) in preprocessing_info['date_columns'].items():
+        X[year_col] = (X[col] // 100).astype(np.int16)
+        X[month_col] = (X[col] % 100).astype(np.int8)
+    X = X.drop(columns=list(preprocessing_info['date_columns']))
+    
+    # Apply the high-cardinality code maps fitted on the full scan
+    for col, encoder in preprocessing_info['feature_encoders'].items():
+        X[col] = X[col].fillna('Unknown').map(encoder)
+    
+    # Clean string values (remove trailing spaces); on a categorical this
+    # strips the categories once instead of every row. Then pin the category
+    # set so get_dummies emits the same columns for every chunk. Blank cells
+    # become the 'Unknown' level when the scan saw one, else the reference level
+    for col, dtype in preprocessing_info['category_dtypes'].items():
+        categories = X[col].cat.categories
+        values = X[col].map(dict(zip(categories, categories.str.strip()))).astype(dtype)
+        if values.hasnans and 'Unknown' in dtype.categories:
+            values = values.fillna('Unknown')
+        X[col] = values
+    
+    # One-hot encode into sparse uint8 columns and put them in feature order
+    X = pd.get_dummies(X, columns=preprocessing_info['categorical_columns'],
+                       drop_first=True, sparse=True, dtype=np.uint8)
+    X = X[preprocessing_info['feature_names']]
+    
+    return X, y
+
+def _stratified_test_mask(y, rng):
+    """Per-class random holdout so both splits keep the class balance"""
+    test_mask = np.zeros(len(y), dtype=bool)
+    for label in (0, 1):
+        idx = np.flatnonzero(y == label)
+        rng.shuffle(idx)
+        test_mask[idx[:int(TEST_SIZE * len(idx))]] = True
+    return test_mask
+
+def _preprocess_chunk(chunk, preprocessing_info):
+    """Preprocess one chunk into (numeric, onehot, y) arrays"""
+    n_numeric = len(preprocessing_info['numeric_columns'])
+    X, y = preprocess_data(chunk, preprocessing_info)
+    numeric = X.iloc[:, :n_numeric].to_numpy(dtype=np.float32)
+    onehot = X.iloc[:, n_numeric:].sparse.to_coo().tocsr().astype(np.float32)
+    return numeric, onehot, y.to_numpy()
+
+def iter_training_chunks(csv_path, preprocessing_info):
+    """Yield preprocessed (numeric, onehot, y, test_mask) chunks
 
-def train_model(X, y):
-    """Train mortgage default prediction model"""
+    The numeric block is a dense float32 array and the mostly-zero one-hot
+    block a float32 CSR matrix. The stratified train/test split is drawn from
+    a freshly seeded generator on every pass, so each epoch sees exactly the
+    same rows in each split.
+    """
+    rng = np.random.default_rng(42)
+    for chunk in read_mortgage_chunks(csv_path):
+        numeric, onehot, y = _preprocess_chunk(chunk, preprocessing_info)
+        yield numeric, onehot, y, _stratified_test_mask(y, rng)
+
+def _stack_features(numeric, onehot):
+    """Join the numeric and one-hot blocks into one float32 CSR matrix"""
+    return sparse.hstack([sparse.csr_matrix(numeric), onehot], format='csr', dtype=np.float32)
+
+def train_model(csv_path, preprocessing_info):
+    """Train mortgage default prediction model with out-of-core partial_fit"""
     print("\nTraining model...")
     
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
+    n_numeric = len(preprocessing_info['numeric_columns'])
+    
+    # SGD needs standardized inputs; fit the scaler on the training rows first
+    scaler = StandardScaler()
+    for numeric, onehot, y, test_mask in iter_training_chunks(csv_path, preprocessing_info):
+        scaler.partial_fit(numeric[~test_mask])
     
     # Train model
-    model = LogisticRegression(random_state=42, max_iter=1000)
-    model.fit(X_train, y_train)
+    model = SGDClassifier(loss='log_loss', random_state=42)
+    for epoch in range(EPOCHS):
+        for numeric, onehot, y, test_mask in iter_training_chunks(csv_path, preprocessing_info):
+            X = _stack_features(scaler.transform(numeric), onehot)
+            model.partial_fit(X[~test_mask], y[~test_mask], classes=[0, 1])
+        print(f"  Epoch {epoch + 1}/{EPOCHS} done")
+    
+    # Fold the scaling into the weights so the saved model takes raw features
+    coef = model.coef_[0, :n_numeric] / scaler.scale_
+    model.intercept_ -= coef @ scaler.mean_
+    model.coef_[0, :n_numeric] = coef
     
     # Evaluate
-    train_acc = accuracy_score(y_train, model.predict(X_train))
-    test_acc = accuracy_score(y_test, model.predict(X_test))
+    train_correct = train_total = test_correct = test_total = 0
+    for numeric, onehot, y, test_mask in iter_training_chunks(csv_path, preprocessing_info):
+        correct = model.predict(_stack_features(numeric, onehot)) == y
+        train_correct += int(correct[~test_mask].sum())
+        train_total += int((~test_mask).sum())
+        test_correct += int(correct[test_mask].sum())
+        test_total += int(test_mask.sum())
+    train_acc = train_correct / train_total
+    test_acc = test_correct / test_total
     
     print(f"  Training accuracy: {train_acc:.3f}")
     print(f"  Test accuracy: {test_acc:.3f}")
@@ -156,17 +330,22 @@ def save_model_and_info(model, preprocessing_info):
     """Save model and preprocessing information"""
     print("\nSaving model and preprocessing info...")
     
-    # Save model
-    model_path = "model.pkl"
-    joblib.dump(model, model_path)
-    print(f"  Model saved: {model_path}")
+    # Save the plain weight arrays the API serves from (no sklearn at runtime)
+    weights_path = "model_weights.npz"
+    np.savez(
+        weights_path,
+        coef=model.coef_[0].astype(np.float32),
+        intercept=np.float32(model.intercept_[0]),
+        model_type=type(model).__name__
+    )
+    print(f"  Model weights saved: {weights_path}")
     
     # Save preprocessing info
     info_path = "preprocessing_info.pkl"
     joblib.dump(preprocessing_info, info_path)
     print(f"  Preprocessing info saved: {info_path}")
     
-    return model_path, info_path
+    return weights_path, info_path
 
 def test_predictions(model, preprocessing_info, sample_df):
     """Test model with sample predictions"""
@@ -175,41 +354,23 @@ def test_predictions(model, preprocessing_info, sample_df):
     # Create test cases from sample data
     test_cases = sample_df.head(3)
     
-    for i, (_, row) in enumerate(test_cases.iterrows()):
-        try:
-            # Convert to the format expected by the API preprocessing
-            test_data = row.drop('EverDelinquent').to_dict()
-            
-            # Simulate the preprocessing (simplified)
-            features = pd.DataFrame([test_data])
-            
-            # Apply encoders
-            for col, encoder in preprocessing_info['feature_encoders'].items():
-                if col in features.columns:
-                    features[col] = encoder.transform(features[col].astype(str))
-            
-            # One-hot encode
-            cat_cols = [col for col in preprocessing_info['categorical_columns'] if col in features.columns]
-            features = pd.get_dummies(features, columns=cat_cols, drop_first=True)
-            
-            # Ensure all features are present
-            for feature in preprocessing_info['feature_names']:
-                if feature not in features.columns:
-                    features[feature] = 0
-            
-            features = features[preprocessing_info['feature_names']]
-            
-            # Make prediction
-            prediction = model.predict(features.values)[0]
-            probability = model.predict_proba(features.values)[0][1]
-            
-            risk = "Low" if probability <= 0.3 else "Medium" if probability <= 0.7 else "High"
-            
-            print(f"  Test {i+1}: Credit={row['CreditScore']}, LTV={row['LTV']}")
-            print(f"          → Prediction={prediction}, Probability={probability:.3f}, Risk={risk}")
-            
-        except Exception as e:
-            print(f"  Test {i+1}: Error - {str(e)}")
+    try:
+        # Run the samples through the exact training transform, driven by the
+        # same preprocessing info the API loads
+        numeric, onehot, _ = _preprocess_chunk(test_cases, preprocessing_info)
+        features = _stack_features(numeric, onehot)
+        predictions = model.predict(features)
+        probabilities = model.predict_proba(features)[:, 1]
+    except Exception as e:
+        print(f"  Error - {str(e)}")
+        return
+    
+    for i, ((_, row), prediction, probability) in enumerate(
+            zip(test_cases.iterrows(), predictions, probabilities)):
+        risk = "Low" if probability <= 0.3 else "Medium" if probability <= 0.7 else "High"
+        
+        print(f"  Test {i+1}: Credit={row['CreditScore']}, LTV={row['LTV']}")
+        print(f"          → Prediction={prediction}, Probability={probability:.3f}, Risk={risk}")
 
 def main():
     """Main function"""
@@ -217,30 +378,31 @@ def main():
     print("=" * 60)
     
     try:
-        # Load REAL mortgage data from your CSV
-        df = load_real_mortgage_data("LoanExport.csv")
+        # Scan REAL mortgage data from your CSV
+        csv_path = "LoanExport.csv"
+        stats = load_real_mortgage_data(csv_path)
         
-        # Preprocess data
-        X, y, preprocessing_info = preprocess_data(df)
+        # Fit preprocessing
+        preprocessing_info = fit_preprocessing(stats)
         
         # Train model
-        model = train_model(X, y)
+        model = train_model(csv_path, preprocessing_info)
         
         # Save model and preprocessing info
-        model_path, info_path = save_model_and_info(model, preprocessing_info)
+        weights_path, info_path = save_model_and_info(model, preprocessing_info)
         
         # Test predictions
-        test_predictions(model, preprocessing_info, df)
+        test_predictions(model, preprocessing_info, stats['sample'])
         
         print(f"\n" + "=" * 60)
         print(f"✅ REAL MORTGAGE MODEL CREATION COMPLETED!")
         print(f"📁 Files created:")
-        print(f"   - {model_path}")
+        print(f"   - {weights_path}")
         print(f"   - {info_path}")
         print(f"🏠 TRAINED ON YOUR ACTUAL DATA:")
-        print(f"   - Dataset: {len(df):,} real mortgage loans")
+        print(f"   - Dataset: {stats['records']:,} real mortgage loans")
         print(f"   - Features: {len(preprocessing_info['feature_names'])}")
-        print(f"   - Default rate: {df['EverDelinquent'].mean():.1%}")
+        print(f"   - Default rate: {stats['delinquent'] / stats['records']:.1%}")
         print(f"🚀 Ready for FastAPI service with REAL model!")
         
     except Exception as e:
@@ -8,11 +8,12 @@ import os
 import logging
 import joblib
 import numpy as np
-import pandas as pd
-from typing import Dict, List, Optional
-from fastapi import FastAPI, HTTPException, status
+import orjson
+from functools import lru_cache
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from contextlib import asynccontextmanager
 import uvicorn
 
@@ -20,23 +21,81 @@ import uvicorn
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global model variables
-model = None
+# Global model variables: the linear model is served from its plain weight
+# arrays, so sklearn is never imported or unpickled by the API
+model_type = None
+weights = None
+bias = None
+weight_list = None
 preprocessing_info = None
 
+# Identical applications (client retries, double submits) reuse their prediction
+PREDICTION_CACHE_SIZE = 4096
+
+def build_feature_index(info):
+    """Precompute feature-name -> column index tables for direct vector writes"""
+    feature_names = info.get('feature_names', [])
+    info['feature_index'] = {name: i for i, name in enumerate(feature_names)}
+    
+    # One column per category except the first (reference) level of each
+    # training-time CategoricalDtype
+    onehot_index = {}
+    for col, dtype in info.get('category_dtypes', {}).items():
+        for value in dtype.categories[1:]:
+            onehot_index[(col, value)] = info['feature_index'][f"{col}_{value}"]
+    info['onehot_index'] = onehot_index
+    
+    info['field_specs'] = build_field_specs(info)
+
+def build_field_specs(info):
+    """Map each input field to how it is encoded and which columns it fills"""
+    feature_index = info['feature_index']
+    onehot_index = info['onehot_index']
+    date_columns = info.get('date_columns', {})
+    feature_encoders = info.get('feature_encoders', {})
+    category_dtypes = info.get('category_dtypes', {})
+    
+    field_specs = {}
+    for col, (year_col, month_col) in date_columns.items():
+        field_specs[col] = ('date', (feature_index[year_col], feature_index[month_col]))
+    for col, encoder in feature_encoders.items():
+        field_specs[col] = ('code', (feature_index[col], encoder))
+    for col in category_dtypes:
+        columns = {value: idx for (onehot_col, value), idx in onehot_index.items() if onehot_col == col}
+        field_specs[col] = ('onehot', columns)
+    
+    # Every column not filled above is a numeric field copied as-is
+    derived = {name for year_month in date_columns.values() for name in year_month}
+    onehot_columns = set(onehot_index.values())
+    for name, idx in feature_index.items():
+        if name not in field_specs and name not in derived and idx not in onehot_columns:
+            field_specs[name] = ('numeric', idx)
+    return field_specs
+
 def load_model_and_info():
     """Load model and preprocessing info"""
-    global model, preprocessing_info
+    global model_type, preprocessing_info, weights, bias, weight_list
     
     try:
-        model_path = os.getenv("MODEL_PATH", "model.pkl")
+        model_path = os.getenv("MODEL_PATH", "model_weights.npz")
         info_path = os.getenv("INFO_PATH", "preprocessing_info.pkl")
         
-        logger.info(f"Loading model from {model_path}")
-        model = joblib.load(model_path)
+        logger.info(f"Loading model weights from {model_path}")
+        with np.load(model_path) as saved:
+            loaded_weights = saved['coef'].astype(np.float32)
+            loaded_bias = np.float32(saved['intercept'])
+            loaded_type = str(saved['model_type'])
         
         logger.info(f"Loading preprocessing info from {info_path}")
-        preprocessing_info = joblib.load(info_path)
+        info = joblib.load(info_path)
+        build_feature_index(info)
+        
+        # Publish only once everything loaded, so a bad file never leaves the
+        # service half-loaded
+        model_type, weights, bias, preprocessing_info = loaded_type, loaded_weights, loaded_bias, info
+        # Plain floats for the float64 sums in score_mortgage and score_batch
+        weight_list = weights.tolist()
+        predict_cached.cache_clear()
         
         logger.info("Model and preprocessing info loaded successfully")
         return True
@@ -81,6 +140,9 @@ app.add_middleware(
 class MortgageInput(BaseModel):
     """Mortgage application input matching LoanExport.csv structure"""
     
+    # Frozen so applications are hashable and can key the prediction cache
+    model_config = ConfigDict(frozen=True)
+    
     # Core loan details
     CreditScore: int = Field(..., ge=300, le=850, description="Credit score")
     OrigUPB: float = Field(..., gt=0, description="Original loan amount")
@@ -124,47 +186,104 @@ class PredictionResponse(BaseModel):
     """Prediction response"""
     prediction: int = Field(..., description="Prediction (0=No Default, 1=Default)")
 
-def preprocess_mortgage_data(data: MortgageInput) -> np.ndarray:
-    """Preprocess mortgage data for prediction"""
+# /predict can only answer 0 or 1, so both response bodies are built once;
+# PredictionResponse is kept as the documented schema
+PREDICTION_BODIES = {
+    prediction: orjson.dumps({"prediction": prediction}) for prediction in (0, 1)
+}
+
+def encode_application(data: MortgageInput) -> list:
+    """Encode one application into (feature column, value) pairs
+
+    The only place the training-time encoding rules live; single and batch
+    predictions both go through it.
+    """
+    field_specs = preprocessing_info['field_specs']
+    pairs = []
+    for col, value in data.model_dump().items():
+        spec = field_specs.get(col)
+        if spec is None or value is None:
+            # Missing optional fields leave their feature at 0
+            continue
+        kind, table = spec
+        if kind == 'numeric':
+            # Rounded to float32, the precision the model was trained on
+            pairs.append((table, float(np.float32(value))))
+        elif kind == 'date':
+            # YYYYMM -> year and month features
+            year_idx, month_idx = table
+            pairs.append((year_idx, value // 100))
+            pairs.append((month_idx, value % 100))
+        elif kind == 'code':
+            # Unknown categories map to the default code 0
+            idx, encoder = table
+            pairs.append((idx, encoder.get(value, 0)))
+        else:
+            # Reference-level and unknown categories have no column
+            idx = table.get(value.strip())
+            if idx is not None:
+                pairs.append((idx, 1))
+    return pairs
+
+def preprocess_mortgage_batch(applications: List[MortgageInput]) -> np.ndarray:
+    """Preprocess a batch of applications into an (N, F) feature matrix"""
     if preprocessing_info is None:
         raise ValueError("Preprocessing info not loaded")
     
-    # Convert to DataFrame for easier processing
-    data_dict = data.model_dump()
-    df = pd.DataFrame([data_dict])
-    
-    # Apply the same preprocessing as training
-    feature_encoders = preprocessing_info.get('feature_encoders', {})
-    
-    # Encode categorical features
-    for col, encoder in feature_encoders.items():
-        if col in df.columns:
-            try:
-                df[col] = encoder.transform(df[col].astype(str))
-            except ValueError:
-                # Handle unknown categories with default value
-                df[col] = 0
-    
-    # Apply one-hot encoding for remaining categoricals
-    categorical_cols = ['PropertyType', 'FirstTimeHomebuyer', 'Occupancy', 
-                       'LoanPurpose', 'Channel', 'PPM', 'ProductType']
-    
-    for col in categorical_cols:
-        if col in df.columns:
-            df = pd.get_dummies(df, columns=[col], drop_first=True)
-    
-    # Ensure all expected features are present
-    expected_features = preprocessing_info.get('feature_names', [])
-    for feature in expected_features:
-        if feature not in df.columns:
-            df[feature] = 0
-    
-    # Select only expected features in correct order
-    df = df[expected_features]
-    
-    return df.values
+    # Write straight into the model's feature layout in one scatter; absent
+    # features stay 0
+    features = np.zeros((len(applications), len(preprocessing_info['feature_index'])), dtype=np.float32)
+    encoded = [encode_application(app) for app in applications]
+    if encoded:
+        rows = np.repeat(np.arange(len(encoded)), [len(pairs) for pairs in encoded])
+        cols, values = zip(*[pair for pairs in encoded for pair in pairs])
+        features[rows, cols] = values
+    return features
+
+# Single and batch scoring share one arithmetic so an application gets the
+# same answer from both endpoints: float64, starting from the bias and adding
+# weight * feature in ascending column order. A BLAS matmul sums in its own
+# order, which can flip predictions that sit right on the decision boundary
+
+def score_batch(features: np.ndarray) -> np.ndarray:
+    """Decision values for an (N, F) feature matrix"""
+    features = features.astype(np.float64)
+    scores = np.full(len(features), float(bias))
+    for idx, weight in enumerate(weight_list):
+        scores += features[:, idx] * weight
+    return scores
+
+def fast_predict(features: np.ndarray) -> np.ndarray:
+    """Predict 0/1 for each feature row without sklearn's input validation"""
+    return (score_batch(features) > 0).astype(int)
+
+def score_mortgage(data: MortgageInput) -> float:
+    """Decision value for one application, without building a feature vector
 
+    Zero features add nothing to the sum, so skipping them keeps it equal to
+    score_batch.
+    """
+    score = float(bias)
+    for idx, value in sorted(encode_application(data)):
+        score += weight_list[idx] * value
+    return score
 
+@lru_cache(maxsize=PREDICTION_CACHE_SIZE)
+def predict_cached(data: MortgageInput) -> int:
+    """Prediction for one application, memoized on the application's fields"""
+    return int(score_mortgage(data) > 0)
+
+def require_model_loaded():
+    """Guard for model-backed endpoints: 503 until the model is loaded
+
+    Called inside the handlers rather than as a route dependency, so request
+    body validation (422) still runs first.
+    """
+    if weights is None or preprocessing_info is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Model or preprocessing info not loaded"
+        )
 
 # API Endpoints
 @app.get("/")
@@ -187,7 +306,7 @@ async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "model_loaded": model is not None,
+        "model_loaded": weights is not None,
         "preprocessing_loaded": preprocessing_info is not None
     }
 
@@ -199,24 +318,15 @@ async def ping():
 @app.post("/predict", response_model=PredictionResponse)
 async def predict(data: MortgageInput):
     """Predict mortgage default"""
-    if model is None or preprocessing_info is None:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Model or preprocessing info not loaded"
-        )
+    require_model_loaded()
     
     try:
-        # Preprocess input
-        features = preprocess_mortgage_data(data)
-        
-        # Make prediction
-        prediction = int(model.predict(features)[0])
+        # Encode and score in one pass over the input fields (cached)
+        prediction = predict_cached(data)
         
         logger.info(f"Prediction: {prediction}")
         
-        return PredictionResponse(
-            prediction=prediction
-        )
+        return Response(content=PREDICTION_BODIES[prediction], media_type="application/json")
         
     except Exception as e:
         logger.error(f"Prediction error: {str(e)}")
@@ -228,11 +338,7 @@ async def predict(data: MortgageInput):
 @app.post("/predict-batch")
 async def predict_batch(applications: List[MortgageInput]):
     """Batch predictions"""
-    if model is None or preprocessing_info is None:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Model or preprocessing info not loaded"
-        )
+    require_model_loaded()
     
     if len(applications) > 100:
         raise HTTPException(
@@ -240,36 +346,33 @@ async def predict_batch(applications: List[MortgageInput]):
             detail="Maximum 100 applications per batch"
         )
     
+    try:
+        # One (N, F) matrix, so the model is called once for the whole batch
+        predictions = fast_predict(preprocess_mortgage_batch(applications))
+    except Exception as e:
+        logger.error(f"Batch prediction error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Batch prediction failed: {str(e)}"
+        )
+    
     results = []
-    for i, app in enumerate(applications):
-        try:
-            features = preprocess_mortgage_data(app)
-            prediction = int(model.predict(features)[0])
-            
-            results.append({
-                "index": i,
-                "loan_amount": app.OrigUPB,
-                "prediction": prediction
-            })
-        except Exception as e:
-            results.append({
-                "index": i,
-                "error": str(e)
-            })
+    for i, (app, prediction) in enumerate(zip(applications, predictions)):
+        results.append({
+            "index": i,
+            "loan_amount": app.OrigUPB,
+            "prediction": int(prediction)
+        })
     
-    return {"results": results}
+    return Response(content=orjson.dumps({"results": results}), media_type="application/json")
 
 @app.get("/model-info")
 async def model_info():
     """Get model information"""
-    if model is None or preprocessing_info is None:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Model not loaded"
-        )
+    require_model_loaded()
     
     return {
-        "model_type": type(model).__name__,
+        "model_type": model_type,
         "features": len(preprocessing_info.get('feature_names', [])),
         "data_structure": "Real mortgage data (LoanExport.csv format)",
         "preprocessing": {
@@ -280,4 +383,15 @@ async def model_info():
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
+    # Auto-reload is for local development only (DEBUG=1); it cannot be
+    # combined with multiple workers. The event loop and HTTP parser stay on
+    # uvicorn's "auto" default, which picks uvloop and httptools when they
+    # are installed; the Procfile and Dockerfile pin them for production
+    debug = os.getenv("DEBUG") == "1"
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        reload=debug,
+        workers=1 if debug else int(os.getenv("WORKERS", 2))
+    )
@@ -4,289 +4,428 @@ Test script for Mortgage Default Prediction API
 Uses real mortgage data structure
 """
 
-import requests
-import json
+import argparse
+import io
+import os
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# orjson is a compiled extension with no PyPy build; fall back to the stdlib
+# encoder so the script stays pure Python under PyPy
+try:
+    import orjson
+    _dumps, _loads = orjson.dumps, orjson.loads
+except ImportError:
+    import json
+    _loads = json.loads
+    def _dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+_SEP_HEAVY = "=" * 50
+_SEP_LIGHT = "-" * 25
+
+# Point at a deployed service (e.g. a Cloud Run HTTPS URL) with API_URL
+BASE_URL = os.getenv("API_URL", "http://localhost:8000").rstrip("/")
+
+# One pooled keep-alive session for every call, so the suite reuses TCP
+# connections (and TLS sessions over HTTPS) instead of opening a new one per request
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+SESSION.mount("http://", _ADAPTER)
+SESSION.mount("https://", _ADAPTER)
+SESSION.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+
+# Sample mortgage application matching real CSV structure
+_LOW_RISK_PAYLOAD = {
+    # Core loan details
+    "CreditScore": 750,
+    "OrigUPB": 250000,
+    "OrigInterestRate": 3.75,
+    "OrigLoanTerm": 360,
+    "DTI": 28,
+    "LTV": 80,
+    "OCLTV": 80,
+    "MIP": 0,
+
+    # Property and borrower details
+    "Units": 1,
+    "NumBorrowers": 2,
+    "PropertyState": "CA",
+    "PropertyType": "SF",
+    "PostalCode": "90210",
+    "MSA": "31080",
+
+    # Loan characteristics
+    "FirstTimeHomebuyer": "N",
+    "Occupancy": "O",
+    "LoanPurpose": "P",
+    "Channel": "R",
+    "PPM": "N",
+    "ProductType": "FRM",
+
+    # Dates
+    "FirstPaymentDate": 202301,
+    "MaturityDate": 205212,
+
+    # Originator/servicer
+    "SellerName": "WELLS",
+    "ServicerName": "WELLS",
+
+    # Performance metrics (optional)
+    "MonthsDelinquent": 0,
+    "MonthsInRepayment": 12
+}
+
+# High-risk mortgage application
+_HIGH_RISK_PAYLOAD = {
+    # Core loan details (high risk profile)
+    "CreditScore": 580,
+    "OrigUPB": 400000,
+    "OrigInterestRate": 6.5,
+    "OrigLoanTerm": 360,
+    "DTI": 48,
+    "LTV": 95,
+    "OCLTV": 95,
+    "MIP": 30,
+
+    # Property and borrower details
+    "Units": 1,
+    "NumBorrowers": 1,
+    "PropertyState": "FL",
+    "PropertyType": "CO",
+    "PostalCode": "33101",
+    "MSA": "33100",
+
+    # Loan characteristics (higher risk)
+    "FirstTimeHomebuyer": "Y",
+    "Occupancy": "I",  # Investment property
+    "LoanPurpose": "C", # Cash-out refi
+    "Channel": "B",
+    "PPM": "Y",
+    "ProductType": "FRM",
+
+    # Dates
+    "FirstPaymentDate": 202206,
+    "MaturityDate": 205205,
+
+    # Originator/servicer
+    "SellerName": "OTHER",
+    "ServicerName": "OTHER",
+
+    # Performance metrics (optional)
+    "MonthsDelinquent": 2,
+    "MonthsInRepayment": 18
+}
 
-BASE_URL = "http://localhost:8000"
+# Multiple mortgage applications
+_BATCH_PAYLOAD = [
+    {
+        "CreditScore": 750, "OrigUPB": 200000, "OrigInterestRate": 3.5,
+        "OrigLoanTerm": 360, "DTI": 25, "LTV": 75, "OCLTV": 75, "MIP": 0,
+        "Units": 1, "NumBorrowers": 2, "PropertyState": "CA", "PropertyType": "SF",
+        "PostalCode": "90210", "MSA": "31080", "FirstTimeHomebuyer": "N",
+        "Occupancy": "O", "LoanPurpose": "P", "Channel": "R", "PPM": "N",
+        "ProductType": "FRM", "FirstPaymentDate": 202301, "MaturityDate": 205212,
+        "SellerName": "WELLS", "ServicerName": "WELLS",
+        "MonthsDelinquent": 0, "MonthsInRepayment": 12
+    },
+    {
+        "CreditScore": 620, "OrigUPB": 350000, "OrigInterestRate": 5.0,
+        "OrigLoanTerm": 360, "DTI": 42, "LTV": 90, "OCLTV": 90, "MIP": 25,
+        "Units": 1, "NumBorrowers": 1, "PropertyState": "TX", "PropertyType": "SF",
+        "PostalCode": "77001", "MSA": "26420", "FirstTimeHomebuyer": "Y",
+        "Occupancy": "O", "LoanPurpose": "P", "Channel": "B", "PPM": "N",
+        "ProductType": "FRM", "FirstPaymentDate": 202212, "MaturityDate": 205211,
+        "SellerName": "QUICKEN", "ServicerName": "QUICKEN",
+        "MonthsDelinquent": 0, "MonthsInRepayment": 8
+    }
+]
+
+# Invalid credit score (too high)
+_INVALID_PAYLOAD = {
+    "CreditScore": 900,  # Invalid
+    "OrigUPB": 250000, "OrigInterestRate": 3.75, "OrigLoanTerm": 360,
+    "DTI": 28, "LTV": 80, "OCLTV": 80, "MIP": 0, "Units": 1,
+    "NumBorrowers": 2, "PropertyState": "CA", "PropertyType": "SF",
+    "PostalCode": "90210", "MSA": "31080", "FirstTimeHomebuyer": "N",
+    "Occupancy": "O", "LoanPurpose": "P", "Channel": "R", "PPM": "N",
+    "ProductType": "FRM", "FirstPaymentDate": 202301, "MaturityDate": 205212,
+    "SellerName": "WELLS", "ServicerName": "WELLS",
+    "MonthsDelinquent": 0, "MonthsInRepayment": 6
+}
+
+# Request bodies are encoded once and sent as raw bytes
+_LOW_RISK_BODY = _dumps(_LOW_RISK_PAYLOAD)
+_RISK_PAIR_BODY = _dumps([_LOW_RISK_PAYLOAD, _HIGH_RISK_PAYLOAD])
+_BATCH_BODY = _dumps(_BATCH_PAYLOAD)
+_INVALID_BODY = _dumps(_INVALID_PAYLOAD)
+
+# Idempotent calls are memoized per process, so re-running a test does not
+# repeat the network round trip
+@lru_cache(maxsize=64)
+def _cached_get(url: str) -> tuple[int, bytes]:
+    response = SESSION.get(url)
+    return response.status_code, response.content
+
+@lru_cache(maxsize=64)
+def _cached_post(url: str, body: bytes) -> tuple[int, bytes]:
+    response = SESSION.post(url, data=body)
+    return response.status_code, response.content
+
+def _safe(label):
+    """Turn an exception raised by a test into a logged failure"""
+    def decorator(test_func):
+        @wraps(test_func)
+        def wrapper(*args, **kwargs):
+            try:
+                return test_func(*args, **kwargs)
+            except Exception as e:
+                print(f"❌ {label} error: {e}")
+                return False
+        return wrapper
+    return decorator
 
+def _check_get(path, label):
+    """Shared GET check: expect 200 and echo the start of the body"""
+    status_code, content = _cached_get(f"{BASE_URL}{path}")
+    if status_code == 200:
+        print(f"✅ {label}: {content[:200].decode(errors='replace')}")
+        return True
+    else:
+        print("❌ %s failed: %d" % (label, status_code))
+        return False
+
+@_safe("Health")
 def test_health():
     """Test health endpoint"""
     print("Testing health check...")
-    try:
-        response = requests.get(f"{BASE_URL}/health")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Health: {data}")
-            return True
-        else:
-            print(f"❌ Health failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Health error: {e}")
-        return False
+    return _check_get("/health", "Health")
 
+@_safe("Model info")
 def test_model_info():
     """Test model info endpoint"""
     print("Testing model info...")
-    try:
-        response = requests.get(f"{BASE_URL}/model-info")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Model info: {data}")
-            return True
-        else:
-            print(f"❌ Model info failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Model info error: {e}")
-        return False
+    return _check_get("/model-info", "Model info")
 
+@_safe("Prediction")
 def test_prediction():
-    """Test prediction with real mortgage structure"""
-    print("Testing mortgage prediction...")
+    """Test a single prediction on the main endpoint"""
+    print("Testing single prediction...")
     
-    # Sample mortgage application matching real CSV structure
-    mortgage_data = {
-        # Core loan details
-        "CreditScore": 750,
-        "OrigUPB": 250000,
-        "OrigInterestRate": 3.75,
-        "OrigLoanTerm": 360,
-        "DTI": 28,
-        "LTV": 80,
-        "OCLTV": 80,
-        "MIP": 0,
-        
-        # Property and borrower details
-        "Units": 1,
-        "NumBorrowers": 2,
-        "PropertyState": "CA",
-        "PropertyType": "SF",
-        "PostalCode": "90210",
-        "MSA": "31080",
-        
-        # Loan characteristics
-        "FirstTimeHomebuyer": "N",
-        "Occupancy": "O",
-        "LoanPurpose": "P",
-        "Channel": "R",
-        "PPM": "N",
-        "ProductType": "FRM",
-        
-        # Dates
-        "FirstPaymentDate": 202301,
-        "MaturityDate": 205212,
-        
-        # Originator/servicer
-        "SellerName": "WELLS",
-        "ServicerName": "WELLS",
-        
-        # Performance metrics (optional)
-        "MonthsDelinquent": 0,
-        "MonthsInRepayment": 12
-    }
+    status_code, content = _cached_post(f"{BASE_URL}/predict", _LOW_RISK_BODY)
     
-    try:
-        response = requests.post(
-            f"{BASE_URL}/predict",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(mortgage_data)
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            prediction = data.get('prediction')
-            print(f"✅ Prediction: {prediction}")
-            return True
-        else:
-            print(f"❌ Prediction failed: {response.status_code}")
-            print(f"Response: {response.text}")
+    if status_code == 200:
+        prediction = _loads(content)['prediction']
+        if prediction not in (0, 1):
+            print(f"❌ Prediction failed: unexpected value {prediction!r}")
             return False
-    except Exception as e:
-        print(f"❌ Prediction error: {e}")
+        print(f"✅ Prediction: {prediction}")
+        return True
+    else:
+        print("❌ Prediction failed: %d" % status_code)
+        print(f"Response: {content.decode()}")
         return False
 
-def test_high_risk_prediction():
-    """Test high-risk mortgage prediction"""
-    print("Testing high-risk mortgage...")
+@_safe("Risk batch")
+def test_low_and_high_risk_batch():
+    """Test low- and high-risk predictions in one batch round trip"""
+    print("Testing low- and high-risk mortgages...")
     
-    # High-risk mortgage application
-    high_risk_data = {
-        # Core loan details (high risk profile)
-        "CreditScore": 580,
-        "OrigUPB": 400000,
-        "OrigInterestRate": 6.5,
-        "OrigLoanTerm": 360,
-        "DTI": 48,
-        "LTV": 95,
-        "OCLTV": 95,
-        "MIP": 30,
-        
-        # Property and borrower details
-        "Units": 1,
-        "NumBorrowers": 1,
-        "PropertyState": "FL",
-        "PropertyType": "CO",
-        "PostalCode": "33101",
-        "MSA": "33100",
-        
-        # Loan characteristics (higher risk)
-        "FirstTimeHomebuyer": "Y",
-        "Occupancy": "I",  # Investment property
-        "LoanPurpose": "C", # Cash-out refi
-        "Channel": "B",
-        "PPM": "Y",
-        "ProductType": "FRM",
-        
-        # Dates
-        "FirstPaymentDate": 202206,
-        "MaturityDate": 205205,
-        
-        # Originator/servicer
-        "SellerName": "OTHER",
-        "ServicerName": "OTHER",
-        
-        # Performance metrics (optional)
-        "MonthsDelinquent": 2,
-        "MonthsInRepayment": 18
-    }
+    status_code, content = _cached_post(f"{BASE_URL}/predict-batch", _RISK_PAIR_BODY)
     
-    try:
-        response = requests.post(
-            f"{BASE_URL}/predict",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(high_risk_data)
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            prediction = data.get('prediction')
-            print(f"✅ High-risk prediction: {prediction}")
-            return True
-        else:
-            print(f"❌ High-risk prediction failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ High-risk prediction error: {e}")
+    if status_code == 200:
+        low_risk, high_risk = _loads(content)['results']
+        for label, result in (("Prediction", low_risk), ("High-risk prediction", high_risk)):
+            if 'error' in result:
+                print("❌ %s failed: %s" % (label, result['error']))
+                return False
+            print(f"✅ {label}: {result['prediction']}")
+        return True
+    else:
+        print("❌ Risk batch failed: %d" % status_code)
+        print(f"Response: {content.decode()}")
         return False
 
+@_safe("Batch prediction")
 def test_batch_prediction():
     """Test batch prediction"""
     print("Testing batch prediction...")
     
-    # Multiple mortgage applications
-    batch_data = [
-        {
-            "CreditScore": 750, "OrigUPB": 200000, "OrigInterestRate": 3.5,
-            "OrigLoanTerm": 360, "DTI": 25, "LTV": 75, "OCLTV": 75, "MIP": 0,
-            "Units": 1, "NumBorrowers": 2, "PropertyState": "CA", "PropertyType": "SF",
-            "PostalCode": "90210", "MSA": "31080", "FirstTimeHomebuyer": "N",
-            "Occupancy": "O", "LoanPurpose": "P", "Channel": "R", "PPM": "N",
-            "ProductType": "FRM", "FirstPaymentDate": 202301, "MaturityDate": 205212,
-            "SellerName": "WELLS", "ServicerName": "WELLS",
-            "MonthsDelinquent": 0, "MonthsInRepayment": 12
-        },
-        {
-            "CreditScore": 620, "OrigUPB": 350000, "OrigInterestRate": 5.0,
-            "OrigLoanTerm": 360, "DTI": 42, "LTV": 90, "OCLTV": 90, "MIP": 25,
-            "Units": 1, "NumBorrowers": 1, "PropertyState": "TX", "PropertyType": "SF",
-            "PostalCode": "77001", "MSA": "26420", "FirstTimeHomebuyer": "Y",
-            "Occupancy": "O", "LoanPurpose": "P", "Channel": "B", "PPM": "N",
-            "ProductType": "FRM", "FirstPaymentDate": 202212, "MaturityDate": 205211,
-            "SellerName": "QUICKEN", "ServicerName": "QUICKEN",
-            "MonthsDelinquent": 0, "MonthsInRepayment": 8
-        }
-    ]
+    status_code, content = _cached_post(f"{BASE_URL}/predict-batch", _BATCH_BODY)
     
-    try:
-        response = requests.post(
-            f"{BASE_URL}/predict-batch",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(batch_data)
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Batch prediction: {len(data['results'])} results")
-            for result in data['results']:
-                if 'error' not in result:
-                    print(f"   Loan {result['index']}: ${result['loan_amount']:,.0f}, Prediction: {result['prediction']}")
-            return True
-        else:
-            print(f"❌ Batch prediction failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Batch prediction error: {e}")
+    if status_code == 200:
+        data = _loads(content)
+        print(f"✅ Batch prediction: {len(data['results'])} results")
+        for result in data['results']:
+            if 'error' not in result:
+                print(f"   Loan {result['index']}: ${result['loan_amount']:,.0f}, Prediction: {result['prediction']}")
+        return True
+    else:
+        print("❌ Batch prediction failed: %d" % status_code)
         return False
 
+@_safe("Validation")
 def test_validation():
     """Test input validation"""
     print("Testing validation...")
     
-    # Invalid credit score (too high)
-    invalid_data = {
-        "CreditScore": 900,  # Invalid
-        "OrigUPB": 250000, "OrigInterestRate": 3.75, "OrigLoanTerm": 360,
-        "DTI": 28, "LTV": 80, "OCLTV": 80, "MIP": 0, "Units": 1,
-        "NumBorrowers": 2, "PropertyState": "CA", "PropertyType": "SF",
-        "PostalCode": "90210", "MSA": "31080", "FirstTimeHomebuyer": "N",
-        "Occupancy": "O", "LoanPurpose": "P", "Channel": "R", "PPM": "N",
-        "ProductType": "FRM", "FirstPaymentDate": 202301, "MaturityDate": 205212,
-        "SellerName": "WELLS", "ServicerName": "WELLS",
-        "MonthsDelinquent": 0, "MonthsInRepayment": 6
-    }
+    # The small 422 body is read in full so the keep-alive connection goes
+    # back to the pool instead of being closed
+    status_code = SESSION.post(f"{BASE_URL}/predict", data=_INVALID_BODY).status_code
     
-    try:
-        response = requests.post(
-            f"{BASE_URL}/predict",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(invalid_data)
-        )
-        
-        if response.status_code == 422:
-            print("✅ Validation working correctly")
-            return True
-        else:
-            print(f"❌ Validation failed: expected 422, got {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Validation error: {e}")
+    if status_code == 422:
+        print("✅ Validation working correctly")
+        return True
+    else:
+        print("❌ Validation failed: expected 422, got %d" % status_code)
         return False
 
+# Test table, built once at import
+_TESTS = (
+    ("Health Check", test_health),
+    ("Model Info", test_model_info),
+    ("Single Prediction", test_prediction),
+    ("Low/High-Risk Prediction", test_low_and_high_risk_batch),
+    ("Batch Prediction", test_batch_prediction),
+    ("Input Validation", test_validation),
+)
+
+class ThreadLocalStdout:
+    """sys.stdout stand-in that gives each test thread its own buffer"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+    
+    def write(self, text):
+        return getattr(self.local, "buffer", self.stream).write(text)
+    
+    def flush(self):
+        self.stream.flush()
+    
+    def capture(self, test_func):
+        """Run one test, returning (passed, printed output)"""
+        self.local.buffer = io.StringIO()
+        try:
+            return test_func(), self.local.buffer.getvalue()
+        finally:
+            del self.local.buffer
+
+def run_tests(tests):
+    """Run independent tests concurrently over the shared session
+
+    Each test's output is captured so it can be replayed in order.
+    """
+    stdout = ThreadLocalStdout(sys.stdout)
+    sys.stdout = stdout
+    try:
+        with ThreadPoolExecutor(max_workers=len(tests)) as pool:
+            return list(pool.map(stdout.capture, [test_func for _, test_func in tests]))
+    finally:
+        sys.stdout = stdout.stream
+
+def _wait_ready(timeout=5.0):
+    """Poll /health with backoff until the service answers, or give up"""
+    deadline = time.monotonic() + timeout
+    delay = 0.02
+    while time.monotonic() < deadline:
+        try:
+            if SESSION.get(f"{BASE_URL}/health", timeout=0.5).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(delay)
+        delay = min(delay * 1.5, 0.25)
+    return False
+
+def run_load(total, concurrency):
+    """Load test: send `total` /predict calls, `concurrency` at a time
+
+    The session pool is resized so every worker keeps its own warm connection.
+    """
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=0)
+    SESSION.mount("http://", adapter)
+    SESSION.mount("https://", adapter)
+    url = f"{BASE_URL}/predict"
+    
+    def one(_):
+        start = time.perf_counter()
+        try:
+            ok = SESSION.post(url, data=_LOW_RISK_BODY).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return ok, time.perf_counter() - start
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    
+    # Latency percentiles only describe requests that actually succeeded
+    latencies = sorted(latency for ok, latency in results if ok)
+    failures = total - len(latencies)
+    print(f"📊 {total} requests, concurrency {concurrency}: {total / elapsed:,.0f} req/s")
+    if latencies:
+        p50 = latencies[(len(latencies) - 1) // 2] * 1000
+        p99 = latencies[int((len(latencies) - 1) * 0.99)] * 1000
+        print(f"⏱️ Latency p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+    if failures:
+        print(f"❌ {failures} requests failed")
+    return failures == 0
+
+def _positive_int(value):
+    """argparse type for counts that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 def main():
-    """Run all tests"""
+    """Run all tests, or a load test with --load"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--load", type=_positive_int, metavar="N", help="send N /predict requests and report throughput")
+    parser.add_argument("--concurrency", type=_positive_int, default=16, help="concurrent requests in load mode (default 16)")
+    args = parser.parse_args()
+    
+    if args.load is not None:
+        print(f"🔥 LOAD TESTING {BASE_URL}/predict")
+        print(_SEP_HEAVY)
+        if not _wait_ready():
+            print(f"⚠️ Service not ready at {BASE_URL}, running anyway")
+        if not run_load(args.load, args.concurrency):
+            sys.exit(1)
+        return
+    
     print("🚀 TESTING MORTGAGE DEFAULT PREDICTION API")
     print("🏠 Using real mortgage data structure")
-    print("=" * 50)
+    print(_SEP_HEAVY)
     
     # Wait for service
     print("Waiting for service...")
-    time.sleep(2)
+    if not _wait_ready():
+        print(f"⚠️ Service not ready at {BASE_URL}, running tests anyway")
     
     # Run tests
-    tests = [
-        ("Health Check", test_health),
-        ("Model Info", test_model_info),
-        ("Low-Risk Prediction", test_prediction),
-        ("High-Risk Prediction", test_high_risk_prediction),
-        ("Batch Prediction", test_batch_prediction),
-        ("Input Validation", test_validation)
-    ]
-    
     passed = 0
-    for name, test_func in tests:
+    for (name, _), (ok, output) in zip(_TESTS, run_tests(_TESTS)):
         print(f"\n📋 {name}")
-        print("-" * 25)
-        if test_func():
+        print(_SEP_LIGHT)
+        print(output, end="")
+        if ok:
             passed += 1
         print()
     
     # Results
-    print("=" * 50)
-    print(f"📊 Results: {passed}/{len(tests)} tests passed")
+    print(_SEP_HEAVY)
+    print(f"📊 Results: {passed}/{len(_TESTS)} tests passed")
     
-    if passed == len(tests):
+    if passed == len(_TESTS):
         print("🎉 All tests passed!")
         print("\n🏠 Your mortgage API is working with real data structure!")
     else:
@@ -0,0 +1,53 @@
+"""
+Tests for the training preprocessing in create_model.py
+Run with: python -m pytest test_create_model.py
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from create_model import (fit_preprocessing, load_real_mortgage_data,
+                          preprocess_data, read_mortgage_chunks)
+
+SOURCE_CSV = Path(__file__).with_name("LoanExport.csv")
+SAMPLE_ROWS = 50
+
+def _write_sample_csv(path, blanks):
+    """Copy the head of LoanExport.csv, blanking the given (row, column) cells"""
+    with open(SOURCE_CSV) as f:
+        header = f.readline()
+        rows = [f.readline().rstrip("\n").split(",") for _ in range(SAMPLE_ROWS)]
+    columns = header.rstrip("\n").split(",")
+    for row, col in blanks:
+        rows[row][columns.index(col)] = ""
+    path.write_text(header + "".join(",".join(row) + "\n" for row in rows))
+    return path
+
+def _preprocess_sample(csv_path):
+    """Scan, fit and preprocess a sample CSV the same way training does"""
+    info = fit_preprocessing(load_real_mortgage_data(str(csv_path)))
+    X, y = preprocess_data(next(read_mortgage_chunks(str(csv_path))), info)
+    return X, y, info
+
+def test_blank_categorical_becomes_unknown(tmp_path):
+    csv_path = _write_sample_csv(tmp_path / "sample.csv", [(1, "PropertyType")])
+    X, y, info = _preprocess_sample(csv_path)
+    
+    assert 'Unknown' in info['category_dtypes']['PropertyType'].categories
+    assert list(X.columns) == info['feature_names']
+    assert len(X) == len(y) == SAMPLE_ROWS
+    assert X['PropertyType_Unknown'].sparse.to_dense().tolist() == [0, 1] + [0] * (SAMPLE_ROWS - 2)
+
+def test_blank_numeric_cells_get_median(tmp_path):
+    blanks = [(0, "CreditScore"), (1, "DTI"), (2, "LTV"), (3, "FirstPaymentDate")]
+    csv_path = _write_sample_csv(tmp_path / "sample.csv", blanks)
+    X, y, info = _preprocess_sample(csv_path)
+    
+    medians = info['numeric_medians']
+    numeric = X[info['numeric_columns']]
+    assert not numeric.isna().to_numpy().any()
+    assert numeric['CreditScore'].iloc[0] == np.float32(medians['CreditScore'])
+    assert numeric['DTI'].iloc[1] == np.float32(medians['DTI'])
+    assert numeric['LTV'].iloc[2] == np.float32(medians['LTV'])
+    assert numeric['FirstPaymentYear'].iloc[3] == medians['FirstPaymentDate'] // 100
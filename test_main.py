@@ -0,0 +1,79 @@
+"""
+Tests that main.py encodes applications exactly as create_model.py trains on them
+Run with: python -m pytest test_main.py
+"""
+
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+import main
+from create_model import (_preprocess_chunk, _stack_features, fit_preprocessing,
+                          load_real_mortgage_data, read_mortgage_chunks)
+from main import MortgageInput
+
+SOURCE_CSV = Path(__file__).with_name("LoanExport.csv")
+SAMPLE_ROWS = 200
+
+def _applications(df):
+    """Build a MortgageInput for every row, with the types the API validates to"""
+    fields = MortgageInput.model_fields
+    applications = []
+    for row in df[list(fields)].itertuples(index=False):
+        values = {}
+        for name, value in zip(fields, row):
+            annotation = fields[name].annotation
+            values[name] = str(value) if annotation is str else float(value) if annotation is float else int(value)
+        applications.append(MortgageInput.model_construct(**values))
+    return applications
+
+def _serve_sample(tmp_path, monkeypatch):
+    """Fit on the head of LoanExport.csv and serve it with fixed random weights
+
+    Returns the applications and the matching training feature matrix.
+    """
+    csv_path = tmp_path / "sample.csv"
+    with open(SOURCE_CSV) as f:
+        csv_path.write_text("".join(islice(f, SAMPLE_ROWS + 1)))
+    info = fit_preprocessing(load_real_mortgage_data(str(csv_path)))
+    
+    # Rows with a missing input field cannot be sent to the API
+    chunk = next(read_mortgage_chunks(str(csv_path)))
+    chunk = chunk.dropna(subset=list(MortgageInput.model_fields) + ['EverDelinquent'])
+    assert len(chunk) > SAMPLE_ROWS // 2
+    
+    numeric, onehot, _ = _preprocess_chunk(chunk, info)
+    expected = _stack_features(numeric, onehot).toarray()
+    
+    # Weights are scaled per column and centred so both predictions occur
+    rng = np.random.default_rng(0)
+    weights = rng.standard_normal(expected.shape[1]) / (np.abs(expected).max(axis=0) + 1)
+    weights = weights.astype(np.float32)
+    main.build_feature_index(info)
+    monkeypatch.setattr(main, "preprocessing_info", info)
+    monkeypatch.setattr(main, "weights", weights)
+    monkeypatch.setattr(main, "weight_list", weights.tolist())
+    monkeypatch.setattr(main, "bias", np.float32(-np.median(expected @ weights)))
+    
+    return _applications(chunk), expected
+
+def test_serving_matches_training_encoding(tmp_path, monkeypatch):
+    applications, expected = _serve_sample(tmp_path, monkeypatch)
+    np.testing.assert_array_equal(main.preprocess_mortgage_batch(applications), expected)
+    
+    predictions = main.fast_predict(expected)
+    assert 0 < predictions.sum() < len(predictions)
+    assert [int(main.score_mortgage(app) > 0) for app in applications] == predictions.tolist()
+
+def test_single_and_batch_scores_agree_at_boundary(tmp_path, monkeypatch):
+    applications, expected = _serve_sample(tmp_path, monkeypatch)
+    
+    # Move the boundary onto each row in turn; both paths must still agree exactly
+    monkeypatch.setattr(main, "bias", np.float32(0))
+    unbiased = main.score_batch(expected)
+    for row in range(0, len(applications), 10):
+        monkeypatch.setattr(main, "bias", np.float32(-unbiased[row]))
+        scores = main.score_batch(expected)
+        assert abs(scores[row]) < 1e-3 * max(1.0, abs(unbiased[row]))
+        assert [main.score_mortgage(app) for app in applications] == scores.tolist()